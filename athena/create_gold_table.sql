@@ -25,6 +25,10 @@ CREATE EXTERNAL TABLE IF NOT EXISTS mailamericas_gold.ventas (
     SIGUE_TENDENCIA_SEMANAL    boolean,
     CORRELACION_MENSUAL        double,
     SIGUE_TENDENCIA_MENSUAL    boolean,
+    TICKETS_ARTICULO           bigint,
+    TICKETS_SUCURSAL           bigint,
+    TICKET_PROMEDIO_USD        double,
+    ARTICULOS_POR_TICKET       double,
     MONTH_NAME                 string 
 )
 PARTITIONED BY (
@@ -0,0 +1,40 @@
+-- Crear base de datos si no existe
+CREATE DATABASE IF NOT EXISTS mailamericas_gold;
+
+-- Eliminar tabla anterior si existe
+DROP TABLE IF EXISTS mailamericas_gold.ventas_tickets;
+
+-- Crear tabla externa de métricas de tickets (empresa, sucursal y departamento; mes y YTD)
+CREATE EXTERNAL TABLE IF NOT EXISTS mailamericas_gold.ventas_tickets (
+    ALCANCE                    string,
+    PERIODO                    string,
+    MONTH                      bigint,
+    SUCURSAL                   string,
+    DEPARTAMENTO               bigint,
+    DESC_DEPARTAMENTO          string,
+    TICKETS_DISTINTOS          bigint,
+    VENTA_USD                  double,
+    CANTIDAD_VENDIDA           bigint,
+    TICKET_PROMEDIO_USD        double,
+    ARTICULOS_POR_TICKET       double
+)
+PARTITIONED BY (
+    year int
+)
+STORED AS PARQUET
+LOCATION 's3://mailamericas-datalake/gold/ventas_tickets/'
+TBLPROPERTIES (
+    'parquet.compress'='SNAPPY',
+    'classification'='parquet',
+    'typeOfData'='file'
+);
+
+-- Actualizar particiones detectadas en S3
+MSCK REPAIR TABLE mailamericas_gold.ventas_tickets;
+
+-- Validar datos
+SELECT *
+FROM mailamericas_gold.ventas_tickets
+WHERE ALCANCE = 'EMPRESA'
+ORDER BY year, MONTH, PERIODO
+LIMIT 24;
\ No newline at end of file
@@ -0,0 +1,131 @@
+# --- Sketches HyperLogLog para conteos distintos combinables ---
+#
+# Cada sketch es un arreglo de 2^p registros uint8 serializado como bytes
+# (columna binaria en Parquet). Dos sketches se combinan con el máximo por
+# registro, por lo que los conteos de empresa o acumulados del año se obtienen
+# uniendo sketches ya guardados sin volver a leer Silver.
+#
+# Serialización: los sketches con pocos registros ocupados (productos con
+# pocos tickets) se guardan dispersos, como pares (registro uint16, valor uint8)
+# de 3 bytes; el resto, denso con exactamente 2^p bytes. El largo distingue
+# ambos formatos: uno disperso solo se usa si ocupa menos que el denso.
+#
+# En Glue se adjunta con `--extra-py-files s3://.../glue_jobs/sketches.py`.
+
+import numpy as np
+import pandas as pd
+
+
+HLL_P = 12                 # 4096 registros por sketch (error estándar ~1.6%)
+HLL_P_ARTICULO = 10        # 1024 registros para el nivel producto (~3.3%)
+SKETCH_COLUMN = "HLL_TICKETS"   # columna de los sketches en el estado GOLD
+_SPARSE = np.dtype([("i", "<u2"), ("v", "u1")])
+
+
+# --- Hash estable de 64 bits de una combinación de columnas ---
+def hash_columns(df, cols):
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy(dtype=np.uint64)
+
+
+# --- Registro y rho (posición del primer bit 1) de cada hash ---
+def _registers(hashes, p):
+    rho_bits = 64 - p
+    idx = (hashes >> np.uint64(rho_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rho_bits) - 1)
+    # frexp da el largo en bits; se desplaza para que el valor sea exacto en float64
+    shift = max(0, rho_bits - 52)
+    high = rest >> np.uint64(shift)
+    bit_length = np.where(
+        high > 0,
+        np.frexp(high.astype(np.float64))[1] + shift,
+        np.frexp(rest.astype(np.float64))[1],
+    )
+    rho = (rho_bits - bit_length + 1).astype(np.uint8)
+    return idx, rho
+
+
+# --- Máximo por (grupo, registro) vía groupby en lugar de np.maximum.at ---
+def _max_by_register(group, idx, rho, p):
+    flat = group * (1 << p) + idx
+    best = pd.Series(rho).groupby(flat).max()
+    flat = best.index.to_numpy(dtype=np.int64)
+    return flat >> p, flat & ((1 << p) - 1), best.to_numpy()
+
+
+# --- Serialización (group ordenado, un sketch por grupo) ---
+def _encode(group, idx, rho, n_groups, p):
+    m = 1 << p
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(group, minlength=n_groups))])
+    packed = np.empty(len(group), dtype=_SPARSE)
+    packed["i"], packed["v"] = idx, rho
+
+    sketches = []
+    for g in range(n_groups):
+        lo, hi = bounds[g], bounds[g + 1]
+        if 3 * (hi - lo) < m:
+            sketches.append(packed[lo:hi].tobytes())
+        else:
+            dense = np.zeros(m, dtype=np.uint8)
+            dense[idx[lo:hi]] = rho[lo:hi]
+            sketches.append(dense.tobytes())
+    return sketches
+
+# Registros ocupados de todos los sketches: (posición del sketch, registro, valor)
+def _decode(values, p):
+    m = 1 << p
+    pos, idx, rho = [], [], []
+    for i, v in enumerate(values):
+        if len(v) == m:
+            dense = np.frombuffer(v, dtype=np.uint8)
+            reg = np.flatnonzero(dense)
+            val = dense[reg]
+        else:
+            packed = np.frombuffer(v, dtype=_SPARSE)
+            reg, val = packed["i"].astype(np.int64), packed["v"]
+        pos.append(np.full(len(reg), i, dtype=np.int64))
+        idx.append(reg)
+        rho.append(val)
+    if not pos:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.uint8)
+    return np.concatenate(pos), np.concatenate(idx), np.concatenate(rho)
+
+
+# --- Sketches por grupo (codes: índice de grupo por fila, -1 = ignorar) ---
+def build_sketches(hashes, codes, n_groups, p=HLL_P):
+    codes = np.asarray(codes, dtype=np.int64)
+    valid = codes >= 0
+    idx, rho = _registers(hashes[valid], p)
+    return _encode(*_max_by_register(codes[valid], idx, rho, p), n_groups, p)
+
+
+# --- Unión de sketches serializados ---
+# union_grouped une en una sola pasada los sketches de cada grupo (codes:
+# grupo de cada sketch, -1 = ignorar), sin iterar grupo por grupo.
+def union_grouped(values, codes, n_groups, p=HLL_P):
+    codes = np.asarray(codes, dtype=np.int64)
+    pos, idx, rho = _decode(values, p)
+    group = codes[pos]
+    valid = group >= 0
+    return _encode(*_max_by_register(group[valid], idx[valid], rho[valid], p), n_groups, p)
+
+def union(values, p=HLL_P):
+    values = list(values)
+    return union_grouped(values, np.zeros(len(values)), 1, p)[0]
+
+
+# --- Estimación de cardinalidad (una por sketch) ---
+def estimate(values, p=HLL_P):
+    m = 1 << p
+    values = list(values)
+    pos, _, rho = _decode(values, p)
+    occupied = np.bincount(pos, minlength=len(values))
+    zeros = m - occupied
+    # Los registros vacíos aportan 2^0 = 1 cada uno
+    total = zeros + np.bincount(pos, weights=np.exp2(-rho.astype(np.float64)), minlength=len(values))
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / total
+
+    # Corrección de rango bajo (linear counting) mientras haya registros vacíos
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.rint(np.where(small, linear, raw)).astype(np.int64)
@@ -0,0 +1,183 @@
+# --- Backend de almacenamiento del datalake (S3 o filesystem local) ---
+#
+# Los jobs Glue acceden al datalake únicamente a través de este módulo, de modo
+# que el pipeline completo puede ejecutarse y perfilarse sin AWS.
+#
+# En Glue se adjunta con `--extra-py-files s3://.../glue_jobs/storage.py`.
+#
+# Opciones (parámetro de job `--NOMBRE valor` o variable de entorno NOMBRE):
+#   STORAGE_BACKEND  "s3" (por defecto) | "local"
+#   BUCKET           bucket del datalake (en modo local, subcarpeta de LOCAL_ROOT)
+#   LOCAL_ROOT       raíz del datalake local (por defecto ./datalake)
+#
+# Las escrituras (write_bytes, write_parquet, write_arrow) devuelven un ETag
+# del objeto escrito en ambos backends: el de S3, o en modo local el MD5 del
+# contenido (lo que S3 devuelve para un put_object de una sola parte).
+
+import hashlib, io, os, sys, tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+DEFAULT_BUCKET = "mailamericas-datalake"
+
+
+# --- Lectura de opciones de configuración ---
+def get_option(name, default=None):
+    flag = f"--{name}"
+    if flag in sys.argv:
+        i = sys.argv.index(flag)
+        if i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return os.environ.get(name, default)
+
+
+# --- Backend S3 ---
+class S3Storage:
+    def __init__(self, bucket):
+        import boto3
+
+        self.bucket = bucket
+        self.client = boto3.client("s3")
+
+    def uri(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+    def read_bytes(self, key):
+        obj = self.client.get_object(Bucket=self.bucket, Key=key)
+        return obj["Body"].read()
+
+    # Devuelve el ETag del objeto escrito (permite reconocer su notificación S3)
+    def write_bytes(self, key, data):
+        resp = self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+        return resp["ETag"].strip('"')
+
+    def exists(self, key):
+        resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=key, MaxKeys=1)
+        return any(it["Key"] == key for it in resp.get("Contents", []))
+
+    def list_keys(self, prefix, suffix=None):
+        keys, cont = [], None
+        while True:
+            resp = (
+                self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix, ContinuationToken=cont)
+                if cont
+                else self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
+            )
+            for it in resp.get("Contents", []):
+                k = it["Key"]
+                if suffix is None or k.lower().endswith(suffix):
+                    keys.append(k)
+            if resp.get("IsTruncated"):
+                cont = resp.get("NextContinuationToken")
+            else:
+                break
+        return keys
+
+    def read_parquet(self, key, columns=None):
+        return pd.read_parquet(io.BytesIO(self.read_bytes(key)), columns=columns)
+
+    def write_parquet(self, key, df):
+        return self.write_arrow(key, pa.Table.from_pandas(df, preserve_index=False))
+
+    def write_arrow(self, key, table):
+        buf = io.BytesIO()
+        pq.write_table(table, buf, compression="snappy")
+        return self.write_bytes(key, buf.getvalue())
+
+
+# --- Backend filesystem local ---
+# Lectura de Parquet vía memory map (Arrow referencia las páginas del archivo
+# sin copiarlas a un buffer intermedio) y escritura atómica con rename.
+class LocalStorage:
+    def __init__(self, bucket, root=None):
+        self.bucket = bucket
+        self.root = os.path.abspath(os.path.join(root or "datalake", bucket))
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def uri(self, key):
+        return self._path(key)
+
+    def read_bytes(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def write_bytes(self, key, data):
+        return self._atomic_write(key, lambda f: f.write(data))
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    # Igual que en S3, prefix es un prefijo de texto (no necesariamente un
+    # directorio completo): se recorre el directorio que lo contiene y se filtra.
+    def list_keys(self, prefix, suffix=None):
+        keys = []
+        parent = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        base = self._path(parent) if parent else self.root
+        if not os.path.isdir(base):
+            return keys
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.startswith(".tmp-"):
+                    continue
+                k = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+                if k.startswith(prefix) and (suffix is None or k.lower().endswith(suffix)):
+                    keys.append(k)
+        return keys
+
+    def read_parquet(self, key, columns=None):
+        return pq.read_table(self._path(key), columns=columns, memory_map=True).to_pandas()
+
+    def write_parquet(self, key, df):
+        return self.write_arrow(key, pa.Table.from_pandas(df, preserve_index=False))
+
+    def write_arrow(self, key, table):
+        return self._atomic_write(key, lambda f: pq.write_table(table, f, compression="snappy"))
+
+    # Escribe en un temporal del mismo directorio y lo publica con os.replace,
+    # de modo que ningún lector ve un archivo a medio escribir. Devuelve el MD5
+    # del contenido, calculado mientras se escribe.
+    def _atomic_write(self, key, write_fn):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                hashed = _HashingWriter(f)
+                write_fn(hashed)
+            os.replace(tmp, path)
+            return hashed.md5.hexdigest()
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+# --- Archivo que acumula el MD5 de lo escrito ---
+class _HashingWriter:
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.md5.update(data)
+        return self.f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+# --- Selección del backend según configuración ---
+def get_storage():
+    bucket = get_option("BUCKET", DEFAULT_BUCKET)
+    backend = get_option("STORAGE_BACKEND", "s3").lower()
+    if backend == "s3":
+        return S3Storage(bucket)
+    if backend == "local":
+        return LocalStorage(bucket, get_option("LOCAL_ROOT"))
+    raise ValueError(f"STORAGE_BACKEND no soportado: {backend} (usar 's3' o 'local')")
@@ -13,30 +13,313 @@ except ImportError:
     import pandas as pd, pyarrow, numpy as np
     print(f"✅ pandas {pd.__version__}, pyarrow {pyarrow.__version__}, numpy {np.__version__}")
 
-import io, re, boto3, traceback
-from botocore.exceptions import ClientError
+import re, threading, traceback
+import sketches
+from storage import get_option, get_storage
 
-# --- Configuración S3 ---
-s3 = boto3.client("s3")
-BUCKET = "mailamericas-datalake"
-SILVER_PATH = "silver/ventas/"
-GOLD_PATH = "gold/ventas/"
+# --- Configuración del datalake (S3 o local, ver storage.py) ---
+storage = get_storage()
+BUCKET = storage.bucket
+SILVER_PATH = get_option("SILVER_PATH", "silver/ventas/")
+GOLD_PATH = get_option("GOLD_PATH", "gold/ventas/")
+GOLD_STATE_PATH = get_option("GOLD_STATE_PATH", "gold/ventas_state/")
 
 # --- Contadores globales ---
 success_count = 0
 error_count = 0
 error_files = []
-
-# --- Función para leer archivo parquet desde S3 ---
-def read_parquet_from_s3(key):
+counter_lock = threading.Lock()
+
+# --- Estado agregado de GOLD ---
+# Por cada partición sucursal/year/month se guardan sumas y conteos por
+# producto, por DIA_MES y por DIA_SEMANA. Las métricas derivadas (márgenes,
+# tops, cumplimiento, tendencias) se recalculan desde este estado, por lo que
+# las filas nuevas de Silver se incorporan sumando su agregado al existente.
+# Los niveles con tickets guardan además el conteo exacto de tickets distintos
+# (N_TICKETS) y, donde corresponde, un sketch HLL (ver sketches.py).
+SUM_FIELDS = [
+    "CANTIDAD_VENDIDA",
+    "VENTA_ARS",
+    "COSTO_ARS",
+    "MARGEN_ARS",
+    "VENTA_USD",
+    "COSTO_USD",
+    "MARGEN_USD"
+]
+
+STATE_LEVELS = {
+    "articulos": ["ID_ARTICULO", "DESC_ARTICULO"],
+    "departamentos": ["DEPARTAMENTO", "DESC_DEPARTAMENTO"],
+    "sucursal": ["ID_SUCURSAL", "DESCRIP_SUCURSAL"],
+    "dias_mes": ["DIA_MES"],
+    "dias_semana": ["DIA_SEMANA"]
+}
+
+# --- Tickets distintos ---
+# Un ticket se identifica por sucursal, día y número: dos particiones, o dos
+# días de una partición, nunca comparten tickets. Por eso el conteo exacto
+# N_TICKETS se suma al combinar estados (el delta son días nuevos) y al
+# consolidar sucursales, meses o el año, y es lo que se publica en GOLD.
+# Los sketches HLL solo se guardan donde los tickets sí se solapan: al unir
+# varios artículos o departamentos de una misma partición (un ticket incluye
+# varios). Cada nivel con sketch indica su precisión: el nivel producto usa
+# una menor (hay un sketch por artículo).
+TICKET_LEVELS = {"articulos", "departamentos", "sucursal"}
+SKETCH_LEVELS = {
+    "articulos": sketches.HLL_P_ARTICULO,
+    "departamentos": sketches.HLL_P
+}
+TICKET_KEY = ["ID_SUCURSAL", "FECHA_DIA", "NUMERO_TICKET"]
+
+# --- Huella por día ---
+# Además de las sumas, cada nivel acumula HUELLA_CLAVES: la suma de un hash por
+# registro de estas columnas. Un día ya agregado se considera sin cambios solo
+# si coinciden todas sus sumas, su conteo y su huella. Se usan solo las claves
+# numéricas (las descripciones dependen de su ID): mezclarlas es aritmética
+# vectorizada, mientras que hashear columnas de texto costaría más que agregar
+# el delta.
+FINGERPRINT_KEYS = ["FECHA", "NUMERO_TICKET", "ID_ARTICULO", "DEPARTAMENTO", "ID_SUCURSAL"]
+COUNT_FIELDS = ["N_REGISTROS", "HUELLA_CLAVES"]
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+# --- Columnas requeridas (esquema SILVER) ---
+REQUIRED_COLS = {
+    "FECHA", "NUMERO_TICKET", "CANTIDAD_TICKET",
+    "ID_SUCURSAL", "DESCRIP_SUCURSAL",
+    "ID_ZONA_SUPERVISION", "DESC_ZONA_SUPERVICION",
+    "ID_ARTICULO", "DESC_ARTICULO",
+    "FAMILIA", "DESC_FAMILIA",
+    "DEPARTAMENTO", "DESC_DEPARTAMENTO",
+    "RUBRO", "DESC_RUBRO",
+    "SUBRUBRO", "DESC_SUBRUBRO",
+    "CANTIDAD_VENDIDA", "VALOR_ARTICULO",
+    "VENTA_BRUTA", "MONTO_IMPUESTOS_INTERNOS",
+    "MONTO_IVA", "COSTO_ARTICULO",
+    "VENTA_ARS", "COSTO_ARS", "MARGEN_ARS",
+    "TIPO_CAMBIO", "VENTA_USD", "COSTO_USD", "MARGEN_USD",
+    "DIA_MES", "DIA_SEMANA"
+}
+
+# --- Función para leer archivo parquet desde el datalake ---
+def read_parquet_from_storage(key):
     try:
-        obj = s3.get_object(Bucket=BUCKET, Key=key)
-        return pd.read_parquet(io.BytesIO(obj["Body"].read()))
+        return storage.read_parquet(key)
     except Exception as e:
         raise RuntimeError(f"Error leyendo Parquet desde {key}: {type(e).__name__} - {e}")
 
+# --- Hash por registro de las columnas clave (32 bits: la suma cabe en int64) ---
+# Mezcla multiplicativa de 64 bits (finalizador de splitmix64) columna a columna.
+def key_fingerprint(df):
+    h = np.zeros(len(df), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for col in FINGERPRINT_KEYS:
+            h ^= df[col].to_numpy().astype("int64").view(np.uint64)
+            h *= np.uint64(0xBF58476D1CE4E5B9)
+            h ^= h >> np.uint64(31)
+            h *= np.uint64(0x94D049BB133111EB)
+            h ^= h >> np.uint64(29)
+    return (h >> np.uint64(32)).astype(np.int64)
+
+# --- Agregaciones del estado ---
+# N_REGISTROS cuenta registros con VENTA_USD informada, de modo que
+# VENTA_USD / N_REGISTROS equivale al promedio usado en las tendencias.
+def state_aggs():
+    aggs = {f: (f, "sum") for f in SUM_FIELDS}
+    aggs["N_REGISTROS"] = ("VENTA_USD", "count")
+    aggs["HUELLA_CLAVES"] = ("HUELLA_CLAVES", "sum")
+    return aggs
+
+# --- Tickets distintos por grupo (codes: grupo de cada fila, -1 = ignorar) ---
+# ticket_ids numera los tickets de 0 a n_tickets - 1; cada par (grupo, ticket)
+# se codifica en un entero y, ordenados, se cuentan los pares distintos.
+def count_tickets(ticket_ids, n_tickets, codes, n_groups):
+    codes = np.asarray(codes, dtype=np.int64)
+    valid = codes >= 0
+    pares = np.sort(codes[valid] * n_tickets + ticket_ids[valid])
+    distintos = pares[np.concatenate([[True], pares[1:] != pares[:-1]])] if len(pares) else pares
+    return np.bincount(distintos // max(n_tickets, 1), minlength=n_groups)
+
+# --- Construir estado agregado desde filas Silver ---
+def build_state(df):
+    ticket_hashes = sketches.hash_columns(df.assign(FECHA_DIA=df["FECHA"].dt.normalize()), TICKET_KEY)
+    ticket_ids, tickets = pd.factorize(ticket_hashes)
+    df = df.assign(HUELLA_CLAVES=key_fingerprint(df))
+
+    state = {}
+    for nivel, keys in STATE_LEVELS.items():
+        grouped = df.groupby(keys)
+        state[nivel] = grouped.agg(**state_aggs()).reset_index()
+
+        if nivel in TICKET_LEVELS:
+            codes = grouped.ngroup().fillna(-1).to_numpy()
+            state[nivel]["N_TICKETS"] = count_tickets(ticket_ids, len(tickets), codes, len(state[nivel]))
+        if nivel in SKETCH_LEVELS:
+            state[nivel][sketches.SKETCH_COLUMN] = sketches.build_sketches(
+                ticket_hashes, codes, len(state[nivel]), SKETCH_LEVELS[nivel]
+            )
+    return state
+
+# --- Combinar dos estados (suma por clave, unión de sketches) ---
+def merge_state(left, right):
+    merged = {}
+    for nivel, keys in STATE_LEVELS.items():
+        combined = pd.concat([left[nivel], right[nivel]], ignore_index=True)
+        grouped = combined.groupby(keys)
+        sumas = SUM_FIELDS + COUNT_FIELDS + (["N_TICKETS"] if nivel in TICKET_LEVELS else [])
+        merged[nivel] = grouped[sumas].sum().reset_index()
+
+        if nivel in SKETCH_LEVELS:
+            codes = grouped.ngroup().fillna(-1).to_numpy()
+            merged[nivel][sketches.SKETCH_COLUMN] = sketches.union_grouped(
+                combined[sketches.SKETCH_COLUMN], codes, len(merged[nivel]), SKETCH_LEVELS[nivel]
+            )
+    return merged
+
+# --- Lectura / escritura del estado de una partición ---
+# Todos los niveles se guardan en un único Parquet (columna NIVEL), de modo que
+# cada escritura reemplaza el estado completo de forma atómica y nunca se leen
+# niveles de versiones distintas. HLL_P registra la precisión de cada sketch;
+# si no coincide con SKETCH_LEVELS, el estado se reconstruye.
+INT_KEYS = {"ID_ARTICULO", "DEPARTAMENTO", "ID_SUCURSAL", "DIA_MES"}
+
+def state_key(suc, y, m):
+    return f"{GOLD_STATE_PATH}sucursal={suc}/year={y}/month={m}/state.parquet"
+
+def load_state(suc, y, m):
+    key = state_key(suc, y, m)
+    if not storage.exists(key):
+        return None
+    stored = storage.read_parquet(key)
+
+    state = {}
+    for nivel, keys in STATE_LEVELS.items():
+        columns = (
+            keys + SUM_FIELDS + COUNT_FIELDS
+            + (["N_TICKETS"] if nivel in TICKET_LEVELS else [])
+            + ([sketches.SKETCH_COLUMN] if nivel in SKETCH_LEVELS else [])
+        )
+        dfs = stored[stored["NIVEL"] == nivel]
+        # Estados incompletos o de versiones anteriores se reconstruyen
+        if dfs.empty or any(c not in dfs.columns for c in columns + ["HLL_P"]):
+            return None
+        if (dfs["HLL_P"] != SKETCH_LEVELS.get(nivel, 0)).any():
+            return None
+        dfs = dfs[columns].reset_index(drop=True)
+        for c in INT_KEYS.intersection(keys):
+            dfs[c] = dfs[c].astype("int64")
+        state[nivel] = dfs
+    return state
+
+def save_state(suc, y, m, state):
+    stored = pd.concat(
+        [dfs.assign(NIVEL=nivel, HLL_P=SKETCH_LEVELS.get(nivel, 0)) for nivel, dfs in state.items()],
+        ignore_index=True
+    )
+    storage.write_parquet(state_key(suc, y, m), stored)
+
+# --- Filas de Silver aún no incorporadas al estado ---
+# El delta son los días del mes que el estado no contiene. Si algún día ya
+# incorporado cambió (cualquier suma, el conteo o la huella de claves) o
+# desapareció, devuelve None y la partición se reconstruye completa.
+# Es una sola agregación por DIA_MES sobre columnas numéricas, sin copiar el
+# resto del DataFrame.
+def split_delta(df, state):
+    previo = state["dias_mes"].set_index("DIA_MES")[SUM_FIELDS + COUNT_FIELDS]
+    actual = (
+        df[["DIA_MES"] + SUM_FIELDS]
+          .assign(HUELLA_CLAVES=key_fingerprint(df))
+          .groupby("DIA_MES").agg(**state_aggs())
+          .reindex(previo.index)
+    )
+
+    sin_cambios = (
+        np.isclose(actual[SUM_FIELDS].to_numpy(dtype=float), previo[SUM_FIELDS].to_numpy(dtype=float), rtol=1e-9, atol=1e-6).all(axis=1)
+        & (actual["N_REGISTROS"] == previo["N_REGISTROS"]).to_numpy()
+        & (actual["HUELLA_CLAVES"] == previo["HUELLA_CLAVES"]).to_numpy()
+    )
+    if not sin_cambios.all():
+        return None
+    return df[~df["DIA_MES"].isin(previo.index)]
+
+# --- Métricas GOLD derivadas del estado ---
+def build_gold(state, sucursal, year, month):
+    # --- Agregación por producto ---
+    result = state["articulos"][STATE_LEVELS["articulos"] + SUM_FIELDS].copy()
+    result.insert(0, "SUCURSAL", sucursal)
+    result.insert(1, "YEAR", year)
+    result.insert(2, "MONTH", month)
+    result["MARGEN_PORC_ARS"] = (result["MARGEN_ARS"] / result["VENTA_ARS"]).fillna(0)
+    result["MARGEN_PORC_USD"] = (result["MARGEN_USD"] / result["VENTA_USD"]).fillna(0)
+
+    # --- Producto top margen ---
+    result["PRODUCTO_TOP_MARGEN"] = result.loc[result["MARGEN_USD"].idxmax(), "DESC_ARTICULO"]
+
+    # --- Día del mes / día de la semana con mayores ventas ---
+    dia_mes = state["dias_mes"]
+    dia_semana = state["dias_semana"]
+    result["DIA_MES_TOP_VENTAS"] = dia_mes.loc[dia_mes["VENTA_USD"].idxmax(), "DIA_MES"]
+    result["DIA_SEMANA_TOP_VENTAS"] = dia_semana.loc[dia_semana["VENTA_USD"].idxmax(), "DIA_SEMANA"]
+
+    # --- Clasificación de cumplimiento ---
+    objetivo = 0.20
+    condiciones = [
+        result["MARGEN_PORC_USD"] < objetivo,
+        result["MARGEN_PORC_USD"] == objetivo,
+        result["MARGEN_PORC_USD"] > objetivo
+    ]
+    valores = ["no alcanzó", "igualó", "superó"]
+    result["CUMPLIMIENTO_OBJETIVO"] = np.select(condiciones, valores, default="sin datos")
+    print("🏁 Clasificación de cumplimiento calculada correctamente.")
+
+    print("🔍 Analizando estacionalidad y tendencias de ventas...")
+
+    # TENDENCIA SEMANAL (venta promedio por registro según día de la semana)
+    # Cada partición contiene una sola sucursal, por lo que la tendencia global
+    # coincide con la de la sucursal.
+    semanal = dia_semana.set_index("DIA_SEMANA")
+    tendencia_semanal = (semanal["VENTA_USD"] / semanal["N_REGISTROS"]).reindex(DIAS_SEMANA)
+    UMBRAL_CORR_SEMANAL = 0.7
+    result["CORRELACION_SEMANAL"] = tendencia_semanal.corr(tendencia_semanal)
+    result["SIGUE_TENDENCIA_SEMANAL"] = result["CORRELACION_SEMANAL"] >= UMBRAL_CORR_SEMANAL
+    print("📅 Tendencia semanal calculada correctamente.")
+
+    # TENDENCIA MENSUAL (venta promedio por registro según día del mes)
+    mensual = dia_mes.set_index("DIA_MES").sort_index()
+    tendencia_mensual = mensual["VENTA_USD"] / mensual["N_REGISTROS"]
+    UMBRAL_CORR_MENSUAL = 0.7
+    result["CORRELACION_MENSUAL"] = tendencia_mensual.corr(tendencia_mensual)
+    result["SIGUE_TENDENCIA_MENSUAL"] = result["CORRELACION_MENSUAL"] >= UMBRAL_CORR_MENSUAL
+    print("🗓️ Tendencia mensual calculada correctamente.")
+    print("📈 Detección de tendencias semanal y mensual completada correctamente.")
+
+    # --- Métricas de tickets (conteos exactos de tickets distintos) ---
+    sucursal_state = state["sucursal"]
+    tickets_sucursal = int(sucursal_state["N_TICKETS"].sum())
+    result["TICKETS_ARTICULO"] = state["articulos"]["N_TICKETS"].to_numpy(dtype=np.int64)
+    result["TICKETS_SUCURSAL"] = tickets_sucursal
+    result["TICKET_PROMEDIO_USD"] = sucursal_state["VENTA_USD"].sum() / tickets_sucursal if tickets_sucursal else np.nan
+    result["ARTICULOS_POR_TICKET"] = sucursal_state["CANTIDAD_VENDIDA"].sum() / tickets_sucursal if tickets_sucursal else np.nan
+    print(f"🎫 Métricas de tickets calculadas ({tickets_sucursal} tickets distintos).")
+
+    # NOMBRE MESES
+
+    month_map = {
+        1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
+        5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
+        9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
+    }
+
+    result["month_name"] = result["MONTH"].map(month_map)
+    return result
+
 # --- Función principal ---
-def process_file(key):
+# En la ejecución encadenada (ventas_run_all.py) la partición Silver llega en
+# memoria como df, ya validada por BRONZE → SILVER (validate=False), y su
+# escritura puede seguir en curso: silver_written espera a que termine y
+# devuelve False si falló, en cuyo caso GOLD y su estado no se escriben.
+# Devuelve True si la partición GOLD y su estado quedaron escritos (o vigentes)
+def process_file(key, df=None, validate=True, silver_written=None):
     global success_count, error_count, error_files
 
     print(f"\n📂 Procesando archivo Silver: {key}")
@@ -50,193 +333,67 @@ def process_file(key):
         month = int(match.group(3))
 
         # --- Leer el archivo parquet ---
-        df = read_parquet_from_s3(key)
-        print(f"✅ Archivo leído correctamente ({len(df)} registros)")
+        if df is None:
+            df = read_parquet_from_storage(key)
+            print(f"✅ Archivo leído correctamente ({len(df)} registros)")
+        else:
+            print(f"✅ Partición recibida en memoria ({len(df)} registros)")
 
         # --- Validar columnas requeridas ---
-        required_cols = {
-            "FECHA", "NUMERO_TICKET", "CANTIDAD_TICKET",
-            "ID_SUCURSAL", "DESCRIP_SUCURSAL",
-            "ID_ZONA_SUPERVISION", "DESC_ZONA_SUPERVICION",
-            "ID_ARTICULO", "DESC_ARTICULO",
-            "FAMILIA", "DESC_FAMILIA",
-            "DEPARTAMENTO", "DESC_DEPARTAMENTO",
-            "RUBRO", "DESC_RUBRO",
-            "SUBRUBRO", "DESC_SUBRUBRO",
-            "CANTIDAD_VENDIDA", "VALOR_ARTICULO",
-            "VENTA_BRUTA", "MONTO_IMPUESTOS_INTERNOS",
-            "MONTO_IVA", "COSTO_ARTICULO",
-            "VENTA_ARS", "COSTO_ARS", "MARGEN_ARS",
-            "TIPO_CAMBIO", "VENTA_USD", "COSTO_USD", "MARGEN_USD",
-            "DIA_MES", "DIA_SEMANA"
-        }
-
-        missing_cols = required_cols - set(df.columns)
-        if missing_cols:
-            raise ValueError(f"❌ Columnas faltantes en {key}: {missing_cols}")
-        print("✅ Validación de columnas exitosa.")
-
-        # --- Agregar columnas de partición ---
-        df["SUCURSAL"] = sucursal
-        df["YEAR"] = year
-        df["MONTH"] = month
-
-        # --- Agregación por producto ---
-        agg = (
-            df.groupby(["SUCURSAL","YEAR","MONTH","ID_ARTICULO","DESC_ARTICULO"], as_index=False)
-            .agg({
-                "CANTIDAD_VENDIDA":"sum",
-                "VENTA_ARS":"sum",
-                "COSTO_ARS":"sum",
-                "MARGEN_ARS":"sum",
-                "VENTA_USD":"sum",
-                "COSTO_USD":"sum",
-                "MARGEN_USD":"sum"
-            })
-        )
-        agg["MARGEN_PORC_ARS"] = (agg["MARGEN_ARS"] / agg["VENTA_ARS"]).fillna(0)
-        agg["MARGEN_PORC_USD"] = (agg["MARGEN_USD"] / agg["VENTA_USD"]).fillna(0)
-
-        # --- Producto top margen ---
-        top_producto = (
-            agg.loc[agg.groupby(["SUCURSAL","YEAR","MONTH"])["MARGEN_USD"].idxmax()][
-                ["SUCURSAL","YEAR","MONTH","DESC_ARTICULO"]
-            ].rename(columns={"DESC_ARTICULO":"PRODUCTO_TOP_MARGEN"})
-        )
-
-        # --- Día del mes con mayores ventas ---
-        dia_mes = (
-            df.groupby(["SUCURSAL","YEAR","MONTH","DIA_MES"])["VENTA_USD"].sum().reset_index()
-        )
-        dia_mes = dia_mes.loc[dia_mes.groupby(["SUCURSAL","YEAR","MONTH"])["VENTA_USD"].idxmax()]
-        dia_mes.rename(columns={"DIA_MES":"DIA_MES_TOP_VENTAS"}, inplace=True)
-
-        # --- Día de la semana con mayores ventas ---
-        dia_semana = (
-            df.groupby(["SUCURSAL","YEAR","MONTH","DIA_SEMANA"])["VENTA_USD"].sum().reset_index()
-        )
-        dia_semana = dia_semana.loc[dia_semana.groupby(["SUCURSAL","YEAR","MONTH"])["VENTA_USD"].idxmax()]
-        dia_semana.rename(columns={"DIA_SEMANA":"DIA_SEMANA_TOP_VENTAS"}, inplace=True)
-
-        # --- Merge de las métricas al DataFrame principal ---
-        result = (
-            agg.merge(top_producto, on=["SUCURSAL","YEAR","MONTH"], how="left")
-               .merge(dia_mes[["SUCURSAL","YEAR","MONTH","DIA_MES_TOP_VENTAS"]], on=["SUCURSAL","YEAR","MONTH"], how="left")
-               .merge(dia_semana[["SUCURSAL","YEAR","MONTH","DIA_SEMANA_TOP_VENTAS"]], on=["SUCURSAL","YEAR","MONTH"], how="left")
-        )
-
-        # --- Clasificación de cumplimiento ---
-        objetivo = 0.20
-        condiciones = [
-            result["MARGEN_PORC_USD"] < objetivo,
-            result["MARGEN_PORC_USD"] == objetivo,
-            result["MARGEN_PORC_USD"] > objetivo
-        ]
-        valores = ["no alcanzó", "igualó", "superó"]
-        result["CUMPLIMIENTO_OBJETIVO"] = np.select(condiciones, valores, default="sin datos")
-        print("🏁 Clasificación de cumplimiento calculada correctamente.")
-
-
-        print("🔍 Analizando estacionalidad y tendencias de ventas...")
-
-        #  TENDENCIA SEMANAL
-
-        tendencia_semanal_global = (
-            df.groupby("DIA_SEMANA")["VENTA_USD"]
-              .mean()
-              .reindex(["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"])
-        )
-
-        tendencia_sucursal_semanal = (
-            df.groupby(["SUCURSAL","DIA_SEMANA"])["VENTA_USD"]
-              .mean()
-              .reset_index()
-        )
-
-        pivot_semanal = tendencia_sucursal_semanal.pivot(
-            index="SUCURSAL", columns="DIA_SEMANA", values="VENTA_USD"
-        ).reindex(columns=tendencia_semanal_global.index)
-
-        pivot_semanal["CORRELACION_SEMANAL"] = pivot_semanal.apply(
-            lambda row: row.corr(tendencia_semanal_global), axis=1
-        )
-        UMBRAL_CORR_SEMANAL = 0.7
-        pivot_semanal["SIGUE_TENDENCIA_SEMANAL"] = (
-            pivot_semanal["CORRELACION_SEMANAL"] >= UMBRAL_CORR_SEMANAL
-        )
-        print("📅 Tendencia semanal calculada correctamente.")
-
-        # TENDENCIA MENSUAL
-
-        tendencia_mensual_global = (
-            df.groupby("DIA_MES")["VENTA_USD"]
-              .mean()
-              .sort_index()
-        )
-
-        tendencia_sucursal_mensual = (
-            df.groupby(["SUCURSAL","DIA_MES"])["VENTA_USD"]
-              .mean()
-              .reset_index()
-        )
-
-        pivot_mensual = tendencia_sucursal_mensual.pivot(
-            index="SUCURSAL", columns="DIA_MES", values="VENTA_USD"
-        ).reindex(columns=tendencia_mensual_global.index)
-
-        pivot_mensual["CORRELACION_MENSUAL"] = pivot_mensual.apply(
-            lambda row: row.corr(tendencia_mensual_global), axis=1
-        )
-        UMBRAL_CORR_MENSUAL = 0.7
-        pivot_mensual["SIGUE_TENDENCIA_MENSUAL"] = (
-            pivot_mensual["CORRELACION_MENSUAL"] >= UMBRAL_CORR_MENSUAL
-        )
-        print("🗓️ Tendencia mensual calculada correctamente.")
-
-        # MEGE FINAL
-
-        tendencia_flags = (
-            pivot_semanal[["CORRELACION_SEMANAL","SIGUE_TENDENCIA_SEMANAL"]]
-            .merge(
-                pivot_mensual[["CORRELACION_MENSUAL","SIGUE_TENDENCIA_MENSUAL"]],
-                left_index=True, right_index=True, how="outer"
-            )
-            .reset_index()
-            .rename(columns={"index":"SUCURSAL"})
-        )
-
-        result = result.merge(tendencia_flags, on="SUCURSAL", how="left")
-        print("📈 Detección de tendencias semanal y mensual completada correctamente.")
-
-        # NOMBRE MESES
-
-        month_map = {
-            1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-            5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-            9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-        }
-        
-        result["month_name"] = result["MONTH"].map(month_map)
-
-        # --- Escritura en S3 particionada ---
-        for (suc, y, m), dfg in result.groupby(["SUCURSAL","YEAR","MONTH"]):
-            try:
-                out_key = f"{GOLD_PATH}sucursal={suc}/year={y}/month={m}/ventas_{suc}_{y}-{m}.parquet"
-                buf = io.BytesIO()
-                dfg.to_parquet(buf, engine="pyarrow", compression="snappy", index=False)
-                s3.put_object(Bucket=BUCKET, Key=out_key, Body=buf.getvalue())
-                print(f"✅ Archivo GOLD guardado correctamente: {out_key}")
-            except Exception as e:
-                print(f"❌ Error escribiendo GOLD ({out_key}): {type(e).__name__} - {e}")
-                traceback.print_exc()
-
-        success_count += 1
+        if validate:
+            missing_cols = REQUIRED_COLS - set(df.columns)
+            if missing_cols:
+                raise ValueError(f"❌ Columnas faltantes en {key}: {missing_cols}")
+            print("✅ Validación de columnas exitosa.")
+
+        if df.empty:
+            raise ValueError(f"❌ Archivo Silver sin registros: {key}")
+
+        out_key = f"{GOLD_PATH}sucursal={sucursal}/year={year}/month={month}/ventas_{sucursal}_{year}-{month}.parquet"
+
+        # --- Incorporar filas nuevas al estado agregado ---
+        state = load_state(sucursal, year, month)
+        delta = split_delta(df, state) if state is not None else None
+
+        if delta is None:
+            if state is not None:
+                print("♻️ Días ya agregados cambiaron en Silver. Se reconstruye el estado completo.")
+            state = build_state(df)
+            print(f"🧮 Estado agregado construido desde {len(df)} registros.")
+        elif delta.empty and storage.exists(out_key):
+            print("⏭️ Sin registros nuevos para la partición. GOLD vigente.")
+            with counter_lock:
+                success_count += 1
+            return True
+        else:
+            state = merge_state(state, build_state(delta))
+            print(f"➕ Estado agregado actualizado con {len(delta)} registros nuevos.")
+
+        result = build_gold(state, sucursal, year, month)
+
+        if silver_written is not None and not silver_written():
+            raise RuntimeError(f"La partición Silver {key} no se pudo escribir; GOLD y su estado no se actualizan.")
+
+        # --- Escritura particionada (GOLD primero, luego el estado) ---
+        try:
+            storage.write_parquet(out_key, result)
+            print(f"✅ Archivo GOLD guardado correctamente: {out_key}")
+            save_state(sucursal, year, month, state)
+            print(f"💾 Estado agregado guardado: {state_key(sucursal, year, month)}")
+        except Exception as e:
+            raise RuntimeError(f"Error escribiendo GOLD ({out_key}): {type(e).__name__} - {e}")
+
+        with counter_lock:
+            success_count += 1
+        return True
 
     except Exception as e:
-        error_count += 1
-        error_files.append(key)
+        with counter_lock:
+            error_count += 1
+            error_files.append(key)
         print(f"❌ Error general procesando {key}: {type(e).__name__} - {e}")
         traceback.print_exc()
+        return False
 
 
 # --- Main ---
@@ -244,13 +401,12 @@ def main():
     global success_count, error_count, error_files
     try:
         print("🏁 Iniciando agregación desde Silver...")
-        response = s3.list_objects_v2(Bucket=BUCKET, Prefix=SILVER_PATH)
-        if "Contents" not in response:
+        keys = storage.list_keys(SILVER_PATH, suffix=".parquet")
+        if not keys:
             raise RuntimeError("No se encontraron archivos en la ruta Silver.")
 
-        for item in response["Contents"]:
-            if item["Key"].endswith(".parquet"):
-                process_file(item["Key"])
+        for key in keys:
+            process_file(key)
 
         print("\n🎉 Proceso SILVER → GOLD finalizado.")
         print(f"✅ Archivos procesados correctamente: {success_count}")
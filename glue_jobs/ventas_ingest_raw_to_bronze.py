@@ -13,19 +13,50 @@ except ImportError:
     import pandas as pd, pyarrow, openpyxl
     print(f"✅ pandas {pd.__version__}, pyarrow {pyarrow.__version__}, openpyxl {openpyxl.__version__}")
 
-import io, os, re, boto3, traceback
-from botocore.exceptions import ClientError
+import io, os, re, threading, traceback
+from storage import get_option, get_storage
 
-# --- Configuración S3 ---
-s3 = boto3.client("s3")
-BUCKET = "mailamericas-datalake"
-RAW_PREFIX = "raw/ventas/"
-BRONZE_PREFIX = "bronze/ventas/"
+# --- Configuración del datalake (S3 o local, ver storage.py) ---
+storage = get_storage()
+BUCKET = storage.bucket
+RAW_PREFIX = get_option("RAW_PREFIX", "raw/ventas/")
+BRONZE_PATH = get_option("BRONZE_PATH", "bronze/ventas/")
 
 # --- Contadores globales ---
 success_count = 0
 error_count = 0
 error_files = []
+counter_lock = threading.Lock()   # process_key corre en varios hilos del scheduler
+
+# --- Columnas requeridas (RAW) ---
+REQUIRED_COLS = {
+    # Identificadores y metadatos base
+    "FECHA",
+    "NUMERO_TICKET",
+    "CANTIDAD_TICKET",
+    "ID_SUCURSAL",
+    "DESCRIP_SUCURSAL",
+    "ID_ZONA_SUPERVISION",
+    "DESC_ZONA_SUPERVICION",
+    "ID_ARTICULO",
+    "DESC_ARTICULO",
+    "FAMILIA",
+    "DESC_FAMILIA",
+    "DEPARTAMENTO",
+    "DESC_DEPARTAMENTO",
+    "RUBRO",
+    "DESC_RUBRO",
+    "SUBRUBRO",
+    "DESC_SUBRUBRO",
+
+    # Métricas de venta originales
+    "CANTIDAD_VENDIDA",
+    "VALOR_ARTICULO",
+    "VENTA_BRUTA",
+    "MONTO_IMPUESTOS_INTERNOS",
+    "MONTO_IVA",
+    "COSTO_ARTICULO"
+}
 
 # --- Normalización del nombre de sucursal ---
 def extract_sucursal_name(key):
@@ -34,25 +65,30 @@ def extract_sucursal_name(key):
     return name.replace(" ", "")
 
 # --- Procesar un archivo individual ---
-def process_key(key):
+# writer(out_key, df) reemplaza la escritura directa (p. ej. escritura asíncrona)
+# y on_partition(out_key, df) recibe cada partición ya escrita para encadenar
+# la etapa siguiente en memoria (ver ventas_run_all.py).
+# Devuelve True si todas las hojas y particiones del archivo quedaron escritas
+def process_key(key, writer=None, on_partition=None):
     global success_count, error_count, error_files
 
     sucursal = extract_sucursal_name(key)
     print(f"\n📂 Procesando archivo: {key} | 🏪 Sucursal detectada: {sucursal}")
 
     try:
-        # --- Lectura del archivo desde S3 ---
-        obj = s3.get_object(Bucket=BUCKET, Key=key)
-        data = obj["Body"].read()
+        # --- Lectura del archivo desde el datalake ---
+        data = storage.read_bytes(key)
         xls = pd.ExcelFile(io.BytesIO(data))
         print(f"✅ Archivo leído correctamente. Hojas detectadas: {xls.sheet_names}")
     except Exception as e:
-        error_count += 1
-        error_files.append(key)
+        with counter_lock:
+            error_count += 1
+            error_files.append(key)
         print(f"❌ Error al leer archivo Excel ({key}): {type(e).__name__} - {e}")
         traceback.print_exc()
-        return
+        return False
 
+    ok = True
     for sheet in xls.sheet_names:
         print(f"📑 Leyendo hoja: {sheet}")
         try:
@@ -64,39 +100,9 @@ def process_key(key):
                 if df[c].dtype == "object":
                     df[c] = df[c].astype(str).str.strip()
 
-            # --- Validar columnas requeridas (RAW) ---
-            required_cols = {
-                # Identificadores y metadatos base
-                "FECHA",
-                "NUMERO_TICKET",
-                "CANTIDAD_TICKET",
-                "ID_SUCURSAL",
-                "DESCRIP_SUCURSAL",
-                "ID_ZONA_SUPERVISION",
-                "DESC_ZONA_SUPERVICION",
-                "ID_ARTICULO",
-                "DESC_ARTICULO",
-                "FAMILIA",
-                "DESC_FAMILIA",
-                "DEPARTAMENTO",
-                "DESC_DEPARTAMENTO",
-                "RUBRO",
-                "DESC_RUBRO",
-                "SUBRUBRO",
-                "DESC_SUBRUBRO",
-    
-                # Métricas de venta originales
-                "CANTIDAD_VENDIDA",
-                "VALOR_ARTICULO",
-                "VENTA_BRUTA",
-                "MONTO_IMPUESTOS_INTERNOS",
-                "MONTO_IVA",
-                "COSTO_ARTICULO"
-            }
-    
-            # --- Validar presencia de columnas ---
-            missing_cols = required_cols - set(df.columns)
-            unexpected_cols = set(df.columns) - required_cols  # para debugging
+            # --- Validar presencia de columnas requeridas (RAW) ---
+            missing_cols = REQUIRED_COLS - set(df.columns)
+            unexpected_cols = set(df.columns) - REQUIRED_COLS  # para debugging
     
             if missing_cols:
                 raise ValueError(
@@ -104,7 +110,7 @@ def process_key(key):
                     f"📋 Columnas detectadas ({len(df.columns)}): {list(df.columns)}"
                 )
             else:
-                print(f"✅ Validación de columnas exitosa: {len(required_cols)} columnas requeridas presentes.")
+                print(f"✅ Validación de columnas exitosa: {len(REQUIRED_COLS)} columnas requeridas presentes.")
     
             # Opcional: advertencia si hay columnas extra no esperadas
             if unexpected_cols:
@@ -128,48 +134,48 @@ def process_key(key):
             # --- Escritura en formato Parquet particionado ---
             for (suc, y, m), dfg in df.groupby(["SUCURSAL", "YEAR", "MONTH"]):
                 dfg = dfg.drop(columns=["SUCURSAL", "YEAR", "MONTH"], errors="ignore")
-                out_key = f"{BRONZE_PREFIX}sucursal={suc}/year={y}/month={m}/ventas_{suc}_{y}-{m}.parquet"
-
-                buf = io.BytesIO()
-                dfg.to_parquet(buf, engine="pyarrow", compression="snappy", index=False)
+                out_key = f"{BRONZE_PATH}sucursal={suc}/year={y}/month={m}/ventas_{suc}_{y}-{m}.parquet"
 
                 try:
-                    s3.put_object(Bucket=BUCKET, Key=out_key, Body=buf.getvalue())
-                    print(f"✅ Parquet guardado correctamente: {out_key}")
+                    if writer is not None:
+                        writer(out_key, dfg)
+                    else:
+                        storage.write_parquet(out_key, dfg)
+                        print(f"✅ Parquet guardado correctamente: {out_key}")
                 except Exception as e:
-                    print(f"❌ Error escribiendo en S3 ({out_key}): {type(e).__name__} - {e}")
+                    ok = False
+                    print(f"❌ Error escribiendo en {storage.uri(out_key)}: {type(e).__name__} - {e}")
                     traceback.print_exc()
+                else:
+                    # Con el writer por defecto, solo particiones escritas se entregan
+                    # a la etapa siguiente. Un writer asíncrono (ventas_run_all.py)
+                    # solo encola la escritura: la etapa siguiente debe esperarla
+                    # antes de persistir resultados derivados.
+                    if on_partition is not None:
+                        on_partition(out_key, dfg)
 
-            success_count += 1
+            with counter_lock:
+                success_count += 1
 
         except Exception as e:
-            error_count += 1
-            error_files.append(f"{key} | hoja: {sheet}")
+            ok = False
+            with counter_lock:
+                error_count += 1
+                error_files.append(f"{key} | hoja: {sheet}")
             print(f"❌ Error procesando hoja {sheet} en {key}: {type(e).__name__} - {e}")
             traceback.print_exc()
 
+    return ok
+
 # --- Listar archivos en RAW ---
 def list_raw_keys():
-    print(f"\n🔍 Buscando archivos en s3://{BUCKET}/{RAW_PREFIX}")
-    keys, cont = [], None
+    print(f"\n🔍 Buscando archivos en {storage.uri(RAW_PREFIX)}")
+    keys = []
     try:
-        while True:
-            resp = (
-                s3.list_objects_v2(Bucket=BUCKET, Prefix=RAW_PREFIX, ContinuationToken=cont)
-                if cont
-                else s3.list_objects_v2(Bucket=BUCKET, Prefix=RAW_PREFIX)
-            )
-            for it in resp.get("Contents", []):
-                k = it["Key"]
-                if k.lower().endswith(".xlsx"):
-                    keys.append(k)
-            if resp.get("IsTruncated"):
-                cont = resp.get("NextContinuationToken")
-            else:
-                break
+        keys = storage.list_keys(RAW_PREFIX, suffix=".xlsx")
         print(f"📦 Archivos encontrados: {len(keys)}")
     except Exception as e:
-        print(f"❌ Error listando objetos S3: {type(e).__name__} - {e}")
+        print(f"❌ Error listando objetos del datalake: {type(e).__name__} - {e}")
         traceback.print_exc()
     return keys
 
@@ -179,7 +185,7 @@ def main():
     try:
         keys = list_raw_keys()
         if not keys:
-            print("⚠️ No se encontraron archivos .xlsx en la ruta raw/ventas")
+            print(f"⚠️ No se encontraron archivos .xlsx en la ruta {RAW_PREFIX}")
             return
 
         for k in keys:
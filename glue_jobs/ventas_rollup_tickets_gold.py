@@ -0,0 +1,139 @@
+print("🚀 Inicio del proceso GOLD → GOLD TICKETS (consolidación de tickets)")
+
+import sys, subprocess
+
+# --- Instalación dinámica de dependencias ---
+try:
+    import pandas as pd
+    import pyarrow
+    import numpy as np
+except ImportError:
+    print("⚙️ Instalando dependencias dinámicamente...")
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas", "pyarrow", "numpy"])
+    import pandas as pd, pyarrow, numpy as np
+    print(f"✅ pandas {pd.__version__}, pyarrow {pyarrow.__version__}, numpy {np.__version__}")
+
+import re, traceback
+from storage import get_option, get_storage
+
+# --- Configuración del datalake (S3 o local, ver storage.py) ---
+storage = get_storage()
+BUCKET = storage.bucket
+GOLD_STATE_PATH = get_option("GOLD_STATE_PATH", "gold/ventas_state/")
+GOLD_TICKETS_PATH = get_option("GOLD_TICKETS_PATH", "gold/ventas_tickets/")
+
+# --- Contadores globales ---
+success_count = 0
+error_count = 0
+error_files = []
+
+# --- Leer niveles del estado GOLD de todas las particiones ---
+def load_state_levels(niveles):
+    frames = {nivel: [] for nivel in niveles}
+    for key in storage.list_keys(GOLD_STATE_PATH, suffix="/state.parquet"):
+        match = re.search(r"sucursal=([^/]+)/year=(\d+)/month=(\d+)/", key)
+        if not match:
+            print(f"⚠️ Ruta de estado no reconocida, se omite: {key}")
+            continue
+        df = storage.read_parquet(key)
+        if "N_TICKETS" not in df.columns:
+            print(f"⚠️ Estado sin conteo de tickets (re-ejecutar SILVER → GOLD), se omite: {key}")
+            continue
+        df["SUCURSAL"] = match.group(1)
+        df["YEAR"] = int(match.group(2))
+        df["MONTH"] = int(match.group(3))
+        for nivel in niveles:
+            frames[nivel].append(df[df["NIVEL"] == nivel])
+    return {
+        nivel: pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+        for nivel, dfs in frames.items()
+    }
+
+# --- Consolidar tickets por dimensión: mes y acumulado del año (YTD) ---
+# Un ticket pertenece a una sola sucursal y día, así que los tickets de
+# distintas particiones nunca se repiten: los conteos exactos se suman.
+def rollup(df, dims, alcance):
+    rows = []
+    for keys, dfy in df.groupby(dims + ["YEAR"], sort=True):
+        # Con pandas < 2, agrupar por una sola columna da claves escalares
+        keys = dict(zip(dims + ["YEAR"], keys if isinstance(keys, tuple) else (keys,)))
+        tickets_ytd, venta_ytd, cantidad_ytd = 0, 0.0, 0
+
+        for month, dfm in dfy.groupby("MONTH", sort=True):
+            tickets_mes = int(dfm["N_TICKETS"].sum())
+            venta, cantidad = dfm["VENTA_USD"].sum(), dfm["CANTIDAD_VENDIDA"].sum()
+            tickets_ytd += tickets_mes
+            venta_ytd += venta
+            cantidad_ytd += cantidad
+
+            for periodo, tickets, v, c in [
+                ("MES", tickets_mes, venta, cantidad),
+                ("YTD", tickets_ytd, venta_ytd, cantidad_ytd)
+            ]:
+                rows.append({
+                    **keys,
+                    "ALCANCE": alcance,
+                    "PERIODO": periodo,
+                    "MONTH": month,
+                    "TICKETS_DISTINTOS": tickets,
+                    "VENTA_USD": v,
+                    "CANTIDAD_VENDIDA": c,
+                    "TICKET_PROMEDIO_USD": v / tickets if tickets else np.nan,
+                    "ARTICULOS_POR_TICKET": c / tickets if tickets else np.nan
+                })
+    return rows
+
+# --- Main ---
+def main():
+    global success_count, error_count, error_files
+    try:
+        print("🏁 Leyendo conteos de tickets desde el estado GOLD...")
+        niveles = load_state_levels(["sucursal", "departamentos"])
+        sucursales, departamentos = niveles["sucursal"], niveles["departamentos"]
+        if sucursales.empty:
+            raise RuntimeError(f"No se encontraron estados GOLD en {GOLD_STATE_PATH}.")
+        print(f"✅ Conteos leídos: {len(sucursales)} sucursal-mes, {len(departamentos)} departamento-sucursal-mes")
+
+        rows = []
+        rows += rollup(sucursales, [], "EMPRESA")
+        rows += rollup(sucursales, ["SUCURSAL"], "SUCURSAL")
+        if not departamentos.empty:
+            rows += rollup(departamentos, ["DEPARTAMENTO", "DESC_DEPARTAMENTO"], "DEPARTAMENTO")
+
+        columnas = [
+            "ALCANCE", "PERIODO", "YEAR", "MONTH", "SUCURSAL",
+            "DEPARTAMENTO", "DESC_DEPARTAMENTO", "TICKETS_DISTINTOS",
+            "VENTA_USD", "CANTIDAD_VENDIDA", "TICKET_PROMEDIO_USD", "ARTICULOS_POR_TICKET"
+        ]
+        result = pd.DataFrame(rows).reindex(columns=columnas)
+        result["DEPARTAMENTO"] = result["DEPARTAMENTO"].astype("Int64")
+        print(f"🎫 Métricas de tickets consolidadas ({len(result)} filas).")
+
+        # --- Escritura particionada por año ---
+        for y, dfg in result.groupby("YEAR"):
+            out_key = f"{GOLD_TICKETS_PATH}year={y}/ventas_tickets_{y}.parquet"
+            try:
+                storage.write_parquet(out_key, dfg.drop(columns=["YEAR"]))
+                print(f"✅ Archivo GOLD TICKETS guardado correctamente: {out_key}")
+                success_count += 1
+            except Exception as e:
+                error_count += 1
+                error_files.append(out_key)
+                print(f"❌ Error escribiendo GOLD TICKETS ({out_key}): {type(e).__name__} - {e}")
+                traceback.print_exc()
+
+        print("\n🎉 Proceso GOLD → GOLD TICKETS finalizado.")
+        print(f"✅ Años escritos correctamente: {success_count}")
+        print(f"⚠️ Años con error: {error_count}")
+        if error_count > 0:
+            print("📄 Archivos con error:")
+            for err in error_files:
+                print(f"   - {err}")
+
+    except Exception as e:
+        print(f"🚨 Error crítico en main(): {type(e).__name__} - {e}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+print("🚀 Inicio del proceso RAW → GOLD encadenado en memoria")
+
+import sys, subprocess
+
+# --- Instalación dinámica de dependencias ---
+try:
+    import pandas as pd
+    import pyarrow
+    import openpyxl
+except ImportError:
+    print("⚙️ Instalando dependencias dinámicamente...")
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas", "pyarrow", "openpyxl"])
+    import pandas as pd, pyarrow, openpyxl
+    print(f"✅ pandas {pd.__version__}, pyarrow {pyarrow.__version__}, openpyxl {openpyxl.__version__}")
+
+import threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+from storage import get_option
+
+# Los tres jobs se reutilizan como módulos (se adjuntan con --extra-py-files)
+import ventas_ingest_raw_to_bronze as bronze
+import ventas_transform_bronze_to_silver as silver
+import ventas_aggregate_silver_to_gold as gold
+
+# --- Configuración ---
+storage = bronze.storage
+WRITE_WORKERS = int(get_option("WRITE_WORKERS", "4"))
+
+
+# --- Persistencia asíncrona de BRONZE y SILVER ---
+# Cada partición se toma como tabla Arrow al momento de encolarla (las etapas
+# siguientes pueden modificar el DataFrame) y se escribe en segundo plano para
+# Athena. Ninguna etapa vuelve a leer lo escrito: la partición pasa en memoria.
+# Como máximo 2 × WRITE_WORKERS tablas esperan o se escriben a la vez: si las
+# escrituras van más lentas que el cómputo, el productor se bloquea en lugar de
+# acumular particiones en memoria. written(key) espera la escritura de una
+# partición e indica si terminó bien.
+class AsyncWriter:
+    def __init__(self, pool, max_inflight=2 * WRITE_WORKERS):
+        self.pool = pool
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.pending = {}
+        self.errors = []
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, key, df):
+        # Dos hojas pueden generar la misma partición: se respeta el orden
+        with self.lock:
+            previous = self.pending.get(key)
+        if previous is not None:
+            previous.result()
+
+        self.slots.acquire()
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            future = self.pool.submit(self._write, key, table)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+
+    def _write(self, key, table):
+        try:
+            storage.write_arrow(key, table)
+            with self.lock:
+                self.failed.discard(key)
+            print(f"✅ Parquet guardado correctamente (asíncrono): {key}")
+        except Exception as e:
+            with self.lock:
+                self.errors.append(key)
+                self.failed.add(key)
+            print(f"❌ Error escribiendo en {storage.uri(key)}: {type(e).__name__} - {e}")
+            traceback.print_exc()
+        finally:
+            self.slots.release()
+
+    # Las escrituras terminadas dejan de retenerse en pending
+    def _done(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def written(self, key):
+        with self.lock:
+            future = self.pending.get(key)
+        if future is not None:
+            future.result()
+        with self.lock:
+            return key not in self.failed
+
+    def wait(self):
+        with self.lock:
+            futures = list(self.pending.values())
+        for future in futures:
+            future.result()
+
+
+# --- Ejecución encadenada RAW → BRONZE → SILVER → GOLD ---
+def run_all(keys=None):
+    exchange_df = silver.load_exchange_rates()
+    if keys is None:
+        keys = bronze.list_raw_keys()
+    if not keys:
+        print(f"⚠️ No se encontraron archivos .xlsx en la ruta {bronze.RAW_PREFIX}")
+        return []
+
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+        writer = AsyncWriter(pool)
+
+        def on_silver(silver_key, df):
+            # GOLD calcula en paralelo a la escritura de SILVER, pero solo
+            # escribe su salida y su estado si esa escritura terminó bien
+            gold.process_file(
+                silver_key, df=df, validate=False,
+                silver_written=lambda: writer.written(silver_key)
+            )
+
+        def on_bronze(bronze_key, df):
+            silver.process_file(bronze_key, exchange_df, df=df, validate=False, writer=writer, on_partition=on_silver)
+
+        for key in keys:
+            bronze.process_key(key, writer=writer, on_partition=on_bronze)
+
+        print("\n⏳ Esperando escrituras pendientes de BRONZE y SILVER...")
+        writer.wait()
+
+    return writer.errors
+
+
+# --- Main ---
+def main():
+    try:
+        write_errors = run_all()
+
+        print("\n🎉 Proceso RAW → GOLD encadenado finalizado.")
+        for etapa, modulo in [("RAW → BRONZE", bronze), ("BRONZE → SILVER", silver), ("SILVER → GOLD", gold)]:
+            print(f"📊 {etapa}: ✅ {modulo.success_count} correctos | ⚠️ {modulo.error_count} con error")
+            for err in modulo.error_files:
+                print(f"   - {err}")
+        if write_errors:
+            print(f"⚠️ Escrituras asíncronas con error: {len(write_errors)}")
+            for err in write_errors:
+                print(f"   - {err}")
+
+    except Exception as e:
+        print(f"🚨 Error crítico en main(): {type(e).__name__} - {e}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
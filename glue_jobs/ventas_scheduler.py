@@ -0,0 +1,459 @@
+print("🚀 Inicio del scheduler por eventos RAW → GOLD (nivel partición)")
+
+import sys, subprocess
+
+# --- Instalación dinámica de dependencias ---
+try:
+    import pandas as pd
+    import pyarrow
+    import openpyxl
+except ImportError:
+    print("⚙️ Instalando dependencias dinámicamente...")
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas", "pyarrow", "openpyxl"])
+    import pandas as pd, pyarrow, openpyxl
+    print(f"✅ pandas {pd.__version__}, pyarrow {pyarrow.__version__}, openpyxl {openpyxl.__version__}")
+
+import json, queue, re, threading, time, traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import unquote_plus
+from storage import get_option
+
+# Los tres jobs se reutilizan como módulos (se adjuntan con --extra-py-files)
+import ventas_ingest_raw_to_bronze as bronze
+import ventas_transform_bronze_to_silver as silver
+import ventas_aggregate_silver_to_gold as gold
+
+# --- Configuración ---
+# EVENT_QUEUE_URL: cola SQS con notificaciones "ObjectCreated" del bucket.
+# Sin cola, las claves se leen de stdin (una por línea) como cola local.
+#
+# El job no queda escuchando de forma permanente: vacía la cola y finaliza tras
+# IDLE_TIMEOUT segundos sin eventos ni tareas en curso. Se dispara cuando hay
+# trabajo, con una regla de EventBridge sobre "Object Created" en raw/ o con
+# una alarma de CloudWatch sobre la profundidad de la cola
+# (ApproximateNumberOfMessagesVisible > 0); ambas inician el job de Glue.
+# Conviene limitar el job a una ejecución concurrente: un disparo durante una
+# ejecución en curso se descarta y sus eventos quedan en la cola.
+storage = bronze.storage
+EVENT_QUEUE_URL = get_option("EVENT_QUEUE_URL")
+SCHEDULER_WORKERS = int(get_option("SCHEDULER_WORKERS", "4"))
+DEBOUNCE_SECONDS = float(get_option("DEBOUNCE_SECONDS", "5"))
+IDLE_TIMEOUT = float(get_option("IDLE_TIMEOUT", "60"))  # sin eventos ni tareas en curso, finaliza
+SELF_WRITE_TTL = float(get_option("SELF_WRITE_TTL", "3600"))
+VISIBILITY_TIMEOUT = int(get_option("VISIBILITY_TIMEOUT", "120"))   # se extiende mientras hay trabajo
+POLL_SECONDS = 20                                       # máximo long polling de SQS
+
+
+# --- Fuente de eventos SQS (notificaciones S3) ---
+class SQSEventSource:
+    notifies_own_writes = True   # las escrituras del scheduler también llegan como eventos
+
+    def __init__(self, queue_url):
+        import boto3
+
+        self.queue_url = queue_url
+        self.client = boto3.client("sqs")
+
+    # Devuelve [(key, etag, receipt_handle)]; [] si no hubo mensajes en el timeout
+    def receive(self, timeout):
+        resp = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=10,
+            VisibilityTimeout=VISIBILITY_TIMEOUT,
+            WaitTimeSeconds=int(max(0, min(POLL_SECONDS, timeout))),
+        )
+        events = []
+        for msg in resp.get("Messages", []):
+            keys = []
+            try:
+                body = json.loads(msg["Body"])
+                for record in body.get("Records", []):
+                    if not record.get("eventName", "").startswith("ObjectCreated"):
+                        continue
+                    if record["s3"]["bucket"]["name"] != storage.bucket:
+                        continue
+                    obj = record["s3"]["object"]
+                    keys.append((unquote_plus(obj["key"]), obj.get("eTag")))
+            except Exception as e:
+                print(f"⚠️ Mensaje SQS no reconocido, se descarta: {type(e).__name__} - {e}")
+            # Mensajes sin registros útiles (p. ej. s3:TestEvent) se confirman igual
+            events += [(k, etag, msg["ReceiptHandle"]) for k, etag in keys] or [(None, None, msg["ReceiptHandle"])]
+        return events
+
+    # Confirma (borra) los mensajes; los rechazos por SQS se informan
+    def ack(self, handles):
+        self._batch(self.client.delete_message_batch, handles, "confirmar")
+
+    # Extiende la visibilidad de mensajes aún en proceso para que SQS no los
+    # reentregue a otro consumidor mientras se trabajan
+    def extend(self, handles, seconds):
+        self._batch(
+            self.client.change_message_visibility_batch, handles, "extender visibilidad de",
+            VisibilityTimeout=int(seconds)
+        )
+
+    def _batch(self, call, handles, accion, **extra):
+        handles = list(dict.fromkeys(handles))
+        for i in range(0, len(handles), 10):
+            entries = [{"Id": str(j), "ReceiptHandle": h, **extra} for j, h in enumerate(handles[i:i + 10])]
+            try:
+                resp = call(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                print(f"⚠️ No se pudo {accion} {len(entries)} mensaje(s) SQS: {type(e).__name__} - {e}")
+                continue
+            for failed in resp.get("Failed", []):
+                print(f"⚠️ No se pudo {accion} mensaje SQS: {failed.get('Code')} - {failed.get('Message')}")
+
+    @property
+    def closed(self):
+        return False
+
+
+# --- Fuente de eventos local (reemplazo de SQS para ejecución sin AWS) ---
+class LocalEventSource:
+    notifies_own_writes = False
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.closed = False
+
+    def put(self, key):
+        self.queue.put(key)
+
+    def close(self):
+        self.queue.put(None)
+
+    # Cola alimentada desde stdin en segundo plano; EOF cierra la fuente
+    def feed_from(self, stream):
+        def _feed():
+            for line in stream:
+                if line.strip():
+                    self.put(line.strip())
+            self.close()
+        threading.Thread(target=_feed, daemon=True).start()
+        return self
+
+    def receive(self, timeout):
+        events = []
+        try:
+            item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+        except queue.Empty:
+            return events
+        while True:
+            if item is None:
+                self.closed = True
+            else:
+                events.append((item, None, None))
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return events
+
+    def ack(self, handles):
+        pass
+
+    def extend(self, handles, seconds):
+        pass
+
+
+# --- Identificación de capa y partición a partir de la clave ---
+PARTITION_RE = re.compile(r"sucursal=([^/]+)/year=(\d+)/month=(\d+)/")
+
+def classify(key):
+    if key.startswith(bronze.RAW_PREFIX) and key.lower().endswith(".xlsx"):
+        return "raw"
+    if key.startswith(silver.BRONZE_PATH) and key.endswith(".parquet"):
+        return "bronze"
+    if key.startswith(gold.SILVER_PATH) and key.endswith(".parquet"):
+        return "silver"
+    return None
+
+def partition_of(key):
+    match = PARTITION_RE.search(key)
+    if not match:
+        raise ValueError(f"No se pudo parsear sucursal/year/month desde el path: {key}")
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+# --- Scheduler a nivel partición ---
+# Grafo de dependencias: clave RAW → particiones BRONZE → partición SILVER →
+# partición GOLD. Cada partición se entrega a la etapa siguiente en cuanto
+# queda escrita (sin esperar al resto del archivo ni de la capa), y el trabajo
+# de una misma sucursal/year/month se serializa con un lock por partición.
+#
+# Confirmación de mensajes: cada clave recibida es la raíz de sus tareas
+# (la etapa inicial y las que derivan de ella). Cuando terminan todas, un
+# mensaje se confirma si todas sus claves terminaron bien; si alguna falló,
+# el mensaje queda sin confirmar y SQS lo reentrega al vencer su visibilidad.
+# Mientras tanto, un hilo extiende la visibilidad de los mensajes pendientes.
+#
+# La recepción no espera a las tareas: el bucle vuelve a leer eventos mientras
+# el pool trabaja, y solo al finalizar se espera lo que sigue en curso. Una
+# clave que llega de nuevo mientras se procesa se vuelve a encolar (el archivo
+# pudo cambiar); sus mensajes se confirman cuando terminan todas sus tareas.
+class PartitionScheduler:
+    def __init__(self, source, workers=SCHEDULER_WORKERS):
+        self.source = source
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.locks = defaultdict(threading.Lock)
+        self.guard = threading.Lock()
+        self.inflight = []
+        self.committed = {}
+        self.lineage = defaultdict(set)
+        self.exchange_df = None
+        self.tasks = defaultdict(int)       # raíz → tareas en curso
+        self.failed = set()                 # raíces con alguna etapa fallida
+        self.handles_of = defaultdict(set)  # raíz → mensajes que la contienen
+        self.waiting = {}                   # mensaje → raíces aún sin terminar
+        self.stopping = threading.Event()
+
+    # --- Utilidades de concurrencia ---
+    def _lock_for(self, partition):
+        with self.guard:
+            return self.locks[partition]
+
+    # Registrar la tarea y sus mensajes a la vez: una raíz que termina no
+    # puede confirmar mensajes de una tarea posterior aún sin encolar
+    def _reserve(self, root, handles=()):
+        with self.guard:
+            self.tasks[root] += 1
+            self.handles_of[root].update(handles)
+
+    def _submit(self, root, fn, *args, handles=()):
+        self._reserve(root, handles)
+        future = self.pool.submit(self._run, root, fn, *args)
+        with self.guard:
+            self.inflight = [f for f in self.inflight if not f.done()]
+            self.inflight.append(future)
+
+    # Una tarea falla si lanza una excepción o si su etapa devuelve False
+    def _run(self, root, fn, *args):
+        ok = False
+        try:
+            ok = fn(*args) is not False
+        except Exception as e:
+            print(f"❌ Error inesperado en tarea {fn.__name__}: {type(e).__name__} - {e}")
+            traceback.print_exc()
+        finally:
+            self._finish(root, ok)
+
+    def _fail(self, root):
+        with self.guard:
+            self.failed.add(root)
+
+    def _wait_inflight(self):
+        while True:
+            with self.guard:
+                pending = [f for f in self.inflight if not f.done()]
+                self.inflight = pending
+            if not pending:
+                return
+            wait(pending)
+
+    # --- Confirmación por clave ---
+    # Cada tarea terminada descuenta de su raíz; al llegar a cero se informa el
+    # linaje de la raíz y se liberan sus mensajes. Un mensaje se confirma cuando
+    # terminan bien todas sus claves; una clave fallida lo retira de la espera
+    # (no se confirma ni se sigue extendiendo).
+    def _finish(self, root, ok):
+        ready = []
+        with self.guard:
+            if not ok:
+                self.failed.add(root)
+            self.tasks[root] -= 1
+            if self.tasks[root]:
+                return
+            del self.tasks[root]
+            ok = root not in self.failed
+            self.failed.discard(root)
+            partitions = self.lineage.pop(root, set())
+            for handle in self.handles_of.pop(root, ()):
+                if handle not in self.waiting:
+                    continue
+                if not ok:
+                    del self.waiting[handle]
+                    continue
+                self.waiting[handle].discard(root)
+                if not self.waiting[handle]:
+                    del self.waiting[handle]
+                    ready.append(handle)
+        if partitions:
+            print(f"🔗 {root} → {len(partitions)} partición(es): {sorted(partitions)}")
+        if not ok:
+            print(f"⚠️ {root} terminó con errores: su mensaje queda sin confirmar (SQS lo reentrega).")
+        if ready:
+            self.source.ack(ready)
+
+    def _heartbeat(self):
+        while not self.stopping.wait(VISIBILITY_TIMEOUT / 3):
+            with self.guard:
+                handles = list(self.waiting)
+            if handles:
+                self.source.extend(handles, VISIBILITY_TIMEOUT)
+
+    # --- Escritura síncrona: la partición queda confirmada al retornar ---
+    # Se recuerda el ETag de cada escritura propia para ignorar la notificación
+    # S3 que genera (evita reprocesar lo recién escrito). Solo se descarta un
+    # evento con la misma clave y ETag. La fuente local no notifica lo que
+    # escribe el scheduler, por lo que con ella no se registra ni descarta nada.
+    def commit(self, key, df):
+        etag = storage.write_parquet(key, df)
+        if self.source.notifies_own_writes:
+            with self.guard:
+                self.committed[key] = (etag, time.time())
+        print(f"✅ Parquet guardado correctamente: {key}")
+
+    # --- Etapas (root: clave del evento que originó la tarea) ---
+    # La escritura BRONZE y su paso a SILVER/GOLD ocurren bajo el mismo lock
+    # de partición: ningún otro evento de esa partición se intercala entre la
+    # escritura y las etapas que derivan de ella
+    def run_raw(self, root, raw_key):
+        def commit_and_chain(bronze_key, df):
+            with self._lock_for(partition_of(bronze_key)):
+                self.commit(bronze_key, df)
+                self.on_bronze(root, bronze_key, df)
+
+        return bronze.process_key(raw_key, writer=commit_and_chain)
+
+    # SILVER y GOLD se ejecutan en el mismo hilo, aún bajo el lock de la partición
+    def on_bronze(self, root, bronze_key, df):
+        with self.guard:
+            self.lineage[root].add(partition_of(bronze_key))
+        if not self.to_silver(root, bronze_key, df):
+            self._fail(root)
+
+    def run_bronze(self, root, bronze_key):
+        with self._lock_for(partition_of(bronze_key)):
+            return self.to_silver(root, bronze_key)
+
+    def to_silver(self, root, bronze_key, df=None):
+        return silver.process_file(
+            bronze_key, self.exchange_df, df=df, validate=df is None,
+            writer=self.commit, on_partition=lambda k, d: self.on_silver(root, k, d)
+        )
+
+    # GOLD se ejecuta en el mismo hilo, aún bajo el lock de la partición
+    def on_silver(self, root, silver_key, df):
+        if not gold.process_file(silver_key, df=df, validate=False):
+            self._fail(root)
+
+    def run_silver(self, root, silver_key):
+        with self._lock_for(partition_of(silver_key)):
+            return gold.process_file(silver_key)
+
+    # --- Despacho de un lote de eventos (clave → mensajes que la contienen) ---
+    # Solo encola: las tareas avanzan en el pool mientras se reciben más eventos
+    def dispatch(self, keys):
+        handlers = {"raw": self.run_raw, "bronze": self.run_bronze, "silver": self.run_silver}
+        for key, handles in keys.items():
+            layer = classify(key)
+            if layer is None:
+                print(f"⏭️ Evento ignorado (fuera de RAW/BRONZE/SILVER): {key}")
+                self._reserve(key, handles)
+                self._finish(key, True)
+                continue
+            print(f"📨 Evento {layer.upper()}: {key}")
+            self._submit(key, handlers[layer], key, key, handles=handles)
+
+    # --- Recepción con de-duplicación de ráfagas ---
+    # Tras el primer evento se siguen leyendo eventos durante DEBOUNCE_SECONDS;
+    # las claves repetidas y las escritas por el propio scheduler se descartan.
+    # Las escrituras propias cuya notificación no llega en SELF_WRITE_TTL
+    # segundos se olvidan, de modo que el registro no crece sin límite.
+    # Cada mensaje queda a la espera de sus claves a procesar; los que no
+    # tienen ninguna se confirman de inmediato. Devuelve clave → mensajes.
+    def collect(self, timeout):
+        events = self.source.receive(timeout)
+        if not events:
+            return []
+        with self.guard:
+            self.waiting.update({h: set() for _, _, h in events if h is not None})
+        deadline = time.time() + DEBOUNCE_SECONDS
+        while not self.source.closed and time.time() < deadline:
+            batch = self.source.receive(deadline - time.time())
+            with self.guard:
+                self.waiting.update({h: set() for _, _, h in batch if h is not None})
+            events += batch
+
+        keys, ready = {}, []
+        with self.guard:
+            expired = time.time() - SELF_WRITE_TTL
+            for key in [k for k, (_, ts) in self.committed.items() if ts < expired]:
+                del self.committed[key]
+            for key, etag, handle in events:
+                if key is None:
+                    continue
+                if etag and self.committed.get(key, (None,))[0] == etag:
+                    del self.committed[key]
+                    continue
+                keys.setdefault(key, set())
+                if handle is not None:
+                    self.waiting[handle].add(key)
+                    keys[key].add(handle)
+            for handle in [h for h, pending in self.waiting.items() if not pending]:
+                del self.waiting[handle]
+                ready.append(handle)
+        if ready:
+            self.source.ack(ready)
+
+        print(f"\n📬 Eventos recibidos: {len(events)} | claves a procesar tras de-duplicación: {len(keys)}")
+        return keys
+
+    def run(self, idle_timeout=IDLE_TIMEOUT):
+        self.exchange_df = silver.load_exchange_rates()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        idle_since = time.time()
+        try:
+            while True:
+                # El long polling no se extiende más allá del tiempo de inactividad
+                timeout = POLL_SECONDS
+                if idle_timeout:
+                    timeout = min(timeout, max(1.0, idle_since + idle_timeout - time.time()))
+                keys = self.collect(timeout)
+                if keys:
+                    self.dispatch(keys)
+                with self.guard:
+                    busy = bool(self.tasks)
+                if keys or busy:
+                    idle_since = time.time()
+
+                if self.source.closed:
+                    print("📭 Fuente de eventos cerrada.")
+                    break
+                if idle_timeout and time.time() - idle_since >= idle_timeout:
+                    print(f"💤 Sin eventos durante {idle_timeout:.0f}s. Finalizando.")
+                    break
+        finally:
+            # Las tareas en curso pueden encolar etapas siguientes: se espera
+            # a que terminen todas antes de cerrar el pool
+            self._wait_inflight()
+            self.stopping.set()
+            self.pool.shutdown(wait=True)
+
+
+# --- Main ---
+def main():
+    try:
+        if EVENT_QUEUE_URL:
+            print(f"👂 Escuchando notificaciones en {EVENT_QUEUE_URL}")
+            source = SQSEventSource(EVENT_QUEUE_URL)
+        else:
+            print("👂 Leyendo claves desde stdin (cola local)")
+            source = LocalEventSource().feed_from(sys.stdin)
+
+        PartitionScheduler(source).run()
+
+        print("\n🎉 Scheduler finalizado.")
+        for etapa, modulo in [("RAW → BRONZE", bronze), ("BRONZE → SILVER", silver), ("SILVER → GOLD", gold)]:
+            print(f"📊 {etapa}: ✅ {modulo.success_count} correctos | ⚠️ {modulo.error_count} con error")
+            for err in modulo.error_files:
+                print(f"   - {err}")
+
+    except Exception as e:
+        print(f"🚨 Error crítico en main(): {type(e).__name__} - {e}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,21 +13,22 @@ except ImportError:
     import pandas as pd, pyarrow, openpyxl
     print(f"✅ pandas {pd.__version__}, pyarrow {pyarrow.__version__}, openpyxl {openpyxl.__version__}")
 
-import io, os, re, boto3, traceback
-from botocore.exceptions import ClientError
+import io, os, re, threading, traceback
+from storage import get_option, get_storage
 
 
-# --- Configuración S3 ---
-s3 = boto3.client("s3")
-BUCKET = "mailamericas-datalake"
-BRONZE_PATH = "bronze/ventas/"
-SILVER_PATH = "silver/ventas/"
-EXCHANGE_PATH = "reference/exchange_rates/exchange_rate_ars_usd_2024.csv"
+# --- Configuración del datalake (S3 o local, ver storage.py) ---
+storage = get_storage()
+BUCKET = storage.bucket
+BRONZE_PATH = get_option("BRONZE_PATH", "bronze/ventas/")
+SILVER_PATH = get_option("SILVER_PATH", "silver/ventas/")
+EXCHANGE_PATH = get_option("EXCHANGE_PATH", "reference/exchange_rates/exchange_rate_ars_usd_2024.csv")
 
 # --- Variables globales para conteo ---
 success_count = 0
 error_count = 0
 error_files = []
+counter_lock = threading.Lock()   # el scheduler procesa particiones en paralelo
 
 
 # --- Campos numéricos esperados ---
@@ -52,12 +53,41 @@ FLOAT_FIELDS = [
     "COSTO_ARTICULO"
 ]
 
+# --- Columnas requeridas (esquema BRONZE) ---
+REQUIRED_COLS = {
+    # Identificadores y metadatos base
+    "FECHA",
+    "NUMERO_TICKET",
+    "CANTIDAD_TICKET",
+    "ID_SUCURSAL",
+    "DESCRIP_SUCURSAL",
+    "ID_ZONA_SUPERVISION",
+    "DESC_ZONA_SUPERVICION",
+    "ID_ARTICULO",
+    "DESC_ARTICULO",
+    "FAMILIA",
+    "DESC_FAMILIA",
+    "DEPARTAMENTO",
+    "DESC_DEPARTAMENTO",
+    "RUBRO",
+    "DESC_RUBRO",
+    "SUBRUBRO",
+    "DESC_SUBRUBRO",
+
+    # Métricas de venta originales
+    "CANTIDAD_VENDIDA",
+    "VALOR_ARTICULO",
+    "VENTA_BRUTA",
+    "MONTO_IMPUESTOS_INTERNOS",
+    "MONTO_IVA",
+    "COSTO_ARTICULO"
+}
+
 # --- Función para leer CSV de tipo de cambio desde S3 ---
 def load_exchange_rates():
     try:
-        print(f"📥 Leyendo tipo de cambio desde s3://{BUCKET}/{EXCHANGE_PATH}")
-        obj = s3.get_object(Bucket=BUCKET, Key=EXCHANGE_PATH)
-        exchange_df = pd.read_csv(io.BytesIO(obj["Body"].read()))
+        print(f"📥 Leyendo tipo de cambio desde {storage.uri(EXCHANGE_PATH)}")
+        exchange_df = pd.read_csv(io.BytesIO(storage.read_bytes(EXCHANGE_PATH)))
         exchange_df.columns = [c.strip().lower() for c in exchange_df.columns]
 
         required_cols = {"year", "month", "exchange_rate_ars_usd"}
@@ -74,7 +104,11 @@ def load_exchange_rates():
 
 
 # --- Procesar archivo de BRONZE ---
-def process_file(key, exchange_df):
+# En la ejecución encadenada (ventas_run_all.py) la partición llega en memoria
+# como df, ya validada por RAW → BRONZE (validate=False); writer y on_partition
+# funcionan igual que en process_key de RAW → BRONZE.
+# Devuelve True si todas las particiones del archivo quedaron escritas
+def process_file(key, exchange_df, df=None, validate=True, writer=None, on_partition=None):
     global success_count, error_count, error_files
 
     print(f"\n📂 Procesando archivo: {key}")
@@ -89,58 +123,31 @@ def process_file(key, exchange_df):
         month = int(match.group(3))
 
         # --- Leer archivo Parquet ---
-        try:
-            obj = s3.get_object(Bucket=BUCKET, Key=key)
-            df = pd.read_parquet(io.BytesIO(obj["Body"].read()))
-            print(f"✅ Archivo leído correctamente ({len(df)} registros)")
-        except Exception as e:
-            raise RuntimeError(f"Error leyendo archivo {key}: {type(e).__name__} - {e}")
-
-        # --- Validar columnas requeridas (esquema BRONZE) ---
-        required_cols = {
-            # Identificadores y metadatos base
-            "FECHA",
-            "NUMERO_TICKET",
-            "CANTIDAD_TICKET",
-            "ID_SUCURSAL",
-            "DESCRIP_SUCURSAL",
-            "ID_ZONA_SUPERVISION",
-            "DESC_ZONA_SUPERVICION",
-            "ID_ARTICULO",
-            "DESC_ARTICULO",
-            "FAMILIA",
-            "DESC_FAMILIA",
-            "DEPARTAMENTO",
-            "DESC_DEPARTAMENTO",
-            "RUBRO",
-            "DESC_RUBRO",
-            "SUBRUBRO",
-            "DESC_SUBRUBRO",
-
-            # Métricas de venta originales
-            "CANTIDAD_VENDIDA",
-            "VALOR_ARTICULO",
-            "VENTA_BRUTA",
-            "MONTO_IMPUESTOS_INTERNOS",
-            "MONTO_IVA",
-            "COSTO_ARTICULO"
-        }
-
-        # --- Validar presencia de columnas ---
-        missing_cols = required_cols - set(df.columns)
-        unexpected_cols = set(df.columns) - required_cols  # para debugging
-
-        if missing_cols:
-            raise ValueError(
-                f"❌ Columnas faltantes en {key}: {missing_cols}\n"
-                f"📋 Columnas detectadas ({len(df.columns)}): {list(df.columns)}"
-            )
+        if df is None:
+            try:
+                df = storage.read_parquet(key)
+                print(f"✅ Archivo leído correctamente ({len(df)} registros)")
+            except Exception as e:
+                raise RuntimeError(f"Error leyendo archivo {key}: {type(e).__name__} - {e}")
         else:
-            print(f"✅ Validación de columnas exitosa: {len(required_cols)} columnas requeridas presentes.")
+            print(f"✅ Partición recibida en memoria ({len(df)} registros)")
 
-        # Opcional: advertencia si hay columnas extra no esperadas
-        if unexpected_cols:
-            print(f"⚠️ Columnas adicionales detectadas (no esperadas en esquema BRONZE): {unexpected_cols}")
+        # --- Validar presencia de columnas requeridas (esquema BRONZE) ---
+        if validate:
+            missing_cols = REQUIRED_COLS - set(df.columns)
+            unexpected_cols = set(df.columns) - REQUIRED_COLS  # para debugging
+
+            if missing_cols:
+                raise ValueError(
+                    f"❌ Columnas faltantes en {key}: {missing_cols}\n"
+                    f"📋 Columnas detectadas ({len(df.columns)}): {list(df.columns)}"
+                )
+            else:
+                print(f"✅ Validación de columnas exitosa: {len(REQUIRED_COLS)} columnas requeridas presentes.")
+
+            # Opcional: advertencia si hay columnas extra no esperadas
+            if unexpected_cols:
+                print(f"⚠️ Columnas adicionales detectadas (no esperadas en esquema BRONZE): {unexpected_cols}")
 
         # --- Tipos numéricos ---
         for col in INT_FIELDS:
@@ -222,33 +229,47 @@ def process_file(key, exchange_df):
         except Exception as e:
             raise RuntimeError(f"Error durante limpieza de datos en {key}: {type(e).__name__} - {e}")
 
-        # --- Escritura en S3 particionada con manejo de errores interno ---
+        # --- Escritura particionada con manejo de errores interno ---
+        ok = True
         for (suc, y, m), dfg in df.groupby(["SUCURSAL", "YEAR", "MONTH"]):
             try:
                 dfg = dfg.drop(columns=["SUCURSAL", "YEAR", "MONTH"], errors="ignore")
                 out_key = f"{SILVER_PATH}sucursal={suc}/year={y}/month={m}/ventas_{suc}_{y}-{m}.parquet"
 
-                buf = io.BytesIO()
-                dfg.to_parquet(buf, engine="pyarrow", compression="snappy", index=False)
-
                 try:
-                    s3.put_object(Bucket=BUCKET, Key=out_key, Body=buf.getvalue())
-                    print(f"✅ Parquet guardado correctamente: {out_key}")
+                    if writer is not None:
+                        writer(out_key, dfg)
+                    else:
+                        storage.write_parquet(out_key, dfg)
+                        print(f"✅ Parquet guardado correctamente: {out_key}")
                 except Exception as e:
-                    print(f"❌ Error escribiendo en S3 ({out_key}): {type(e).__name__} - {e}")
+                    ok = False
+                    print(f"❌ Error escribiendo en {storage.uri(out_key)}: {type(e).__name__} - {e}")
                     traceback.print_exc()
+                else:
+                    # Con el writer por defecto, solo particiones escritas se entregan
+                    # a la etapa siguiente. Un writer asíncrono (ventas_run_all.py)
+                    # solo encola la escritura: la etapa siguiente debe esperarla
+                    # antes de persistir resultados derivados.
+                    if on_partition is not None:
+                        on_partition(out_key, dfg)
 
             except Exception as e:
+                ok = False
                 print(f"❌ Error procesando partición {suc}/{y}/{m} en {key}: {type(e).__name__} - {e}")
                 traceback.print_exc()
 
-        success_count += 1
+        with counter_lock:
+            success_count += 1
+        return ok
 
     except Exception as e:
-        error_count += 1
-        error_files.append(key)
+        with counter_lock:
+            error_count += 1
+            error_files.append(key)
         print(f"❌ Error general procesando {key}: {type(e).__name__} - {e}")
         traceback.print_exc()
+        return False
 
 
 # --- Main ---
@@ -258,18 +279,18 @@ def main():
         print("🏁 Iniciando carga de archivos desde Bronze...")
         exchange_df = load_exchange_rates()
 
-        response = s3.list_objects_v2(Bucket=BUCKET, Prefix=BRONZE_PATH)
-        if "Contents" not in response:
+        keys = storage.list_keys(BRONZE_PATH, suffix=".parquet")
+        if not keys:
             raise RuntimeError("No se encontraron archivos en la ruta Bronze.")
 
-        for item in response["Contents"]:
+        for key in keys:
             try:
-                if item["Key"].endswith(".parquet"):
-                    process_file(item["Key"], exchange_df)
+                process_file(key, exchange_df)
             except Exception as e:
-                error_count += 1
-                error_files.append(item["Key"])
-                print(f"❌ Error inesperado en iteración con {item['Key']}: {type(e).__name__} - {e}")
+                with counter_lock:
+                    error_count += 1
+                    error_files.append(key)
+                print(f"❌ Error inesperado en iteración con {key}: {type(e).__name__} - {e}")
                 traceback.print_exc()
 
         print("\n🎉 Proceso BRONZE → SILVER finalizado.")